@@ -5,11 +5,17 @@ from pathlib import Path
 
 REPO_ROOT = Path(__file__).resolve().parents[2]
 
+# The loader and report modules live at the repo root (not inside this package)
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from reports.visualizations import DB_PATH, connect_report_db, save_html_report
+
 
 @asset(config_schema={"mode": Field(str, default_value="incremental")})
 def extract_and_load(context):
     """
-    Loads GitHub stargazers into DuckDB via github_stargazers_loader.py.
+    Loads GitHub stargazers into DuckDB via github_stargazers_loader.main.
 
     Mode is controlled via Dagster Launchpad config:
       - incremental (default)
@@ -17,16 +23,10 @@ def extract_and_load(context):
     """
     mode = context.op_config["mode"]
 
-    result = subprocess.run(
-        [sys.executable, "github_stargazers_loader.py", "--mode", mode],
-        stdout=subprocess.PIPE, 
-        stderr=subprocess.STDOUT,    
-        text=True,
-        check=True,
-        cwd=REPO_ROOT,
-    )
-    # send subprocess output to Dagster logs
-    print(result.stdout)
+    # Imported lazily so loading the code location doesn't pull in dlt
+    from github_stargazers_loader import main as run_loader
+
+    run_loader(mode=mode, log=context.log.info, base_dir=REPO_ROOT)
 
 
 @asset(deps=[extract_and_load])
@@ -46,9 +46,11 @@ def dbt_transform():
 
 
 @asset(deps=[dbt_transform])
-def generate_reports():
-    subprocess.run(
-        [sys.executable, "reports/visualizations.py"],
-        check=True,
-        cwd=REPO_ROOT,
-    )
\ No newline at end of file
+def generate_reports(context):
+    con = connect_report_db(REPO_ROOT / DB_PATH)
+    try:
+        out_path = save_html_report(con, out_dir=REPO_ROOT / "reports")
+    finally:
+        con.close()
+
+    context.log.info(f"Saved {out_path}")
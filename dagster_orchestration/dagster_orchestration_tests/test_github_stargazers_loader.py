@@ -0,0 +1,473 @@
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import dlt
+import duckdb
+import httpx
+import orjson
+import pyarrow as pa
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import github_stargazers_loader as loader
+
+GQL_URL = "https://api.github.com/graphql"
+BASE_TS = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def star_ts(i: int) -> str:
+    return loader.format_github_ts(BASE_TS + timedelta(hours=i))
+
+
+class FakeGitHub:
+    """
+    Minimal GraphQL endpoint for httpx.MockTransport: one star per hour per repo, 100 edges per page,
+    cursors are list offsets. Serves both the aliased first-page batch (r0, r1, ...) and the
+    single-repo page query, and counts POSTs.
+    """
+
+    def __init__(self, star_counts, missing=()):
+        self.star_counts = dict(star_counts)
+        self.missing = set(missing)
+        self.posts = 0
+
+    def page(self, slug, direction, after):
+        stars = [
+            (star_ts(i), f"{slug.split('/')[1]}-u{i}", hash(slug) % 1000 * 100_000 + i)
+            for i in range(self.star_counts[slug])
+        ]
+        if direction == "DESC":
+            stars.reverse()
+        start = int(after) if after else 0
+        chunk = stars[start:start + 100]
+        end = start + len(chunk)
+        return {
+            "stargazers": {
+                "pageInfo": {"endCursor": str(end), "hasNextPage": end < len(stars)},
+                "edges": [
+                    {"starredAt": ts, "node": {"login": login, "databaseId": user_id}}
+                    for ts, login, user_id in chunk
+                ],
+            }
+        }
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.posts += 1
+        body = orjson.loads(request.content)
+        direction = "DESC" if "DESC" in body["query"] else "ASC"
+        variables = body["variables"]
+
+        if "o0" in variables:
+            data, errors = {}, []
+            i = 0
+            while f"o{i}" in variables:
+                slug = f"{variables[f'o{i}']}/{variables[f'n{i}']}"
+                if slug in self.missing:
+                    data[f"r{i}"] = None
+                    errors.append({"type": "NOT_FOUND", "path": [f"r{i}"], "message": f"Could not resolve {slug}"})
+                else:
+                    data[f"r{i}"] = self.page(slug, direction, None)
+                i += 1
+            payload = {"data": data, **({"errors": errors} if errors else {})}
+        else:
+            slug = f"{variables['owner']}/{variables['name']}"
+            payload = {"data": {"repository": self.page(slug, direction, variables["after"])}}
+
+        return httpx.Response(
+            200,
+            json=payload,
+            headers={"x-ratelimit-remaining": "4999", "x-ratelimit-reset": "9999999999"},
+        )
+
+    def client(self) -> httpx.Client:
+        return httpx.Client(transport=httpx.MockTransport(self.handler))
+
+
+class FakeClock:
+    """Replaces the loader's `time` module: sleep() is recorded and advances now() only if `advance`."""
+
+    def __init__(self, now=1_000_000.0, advance=True):
+        self.now = now
+        self.advance = advance
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        if self.advance:
+            self.now += seconds
+
+
+# ----------------------------
+# GitHubRateLimiter
+# ----------------------------
+def limiter_at(clock, remaining, reset_in):
+    limiter = loader.GitHubRateLimiter(threshold=100)
+    limiter.update(httpx.Headers({"x-ratelimit-remaining": str(remaining), "x-ratelimit-reset": str(clock.now + reset_in)}))
+    return limiter
+
+
+def test_acquire_above_threshold_does_not_wait(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(loader, "time", clock)
+    limiter = limiter_at(clock, remaining=4000, reset_in=3600)
+
+    for _ in range(3):
+        limiter.acquire()
+
+    assert clock.sleeps == [0.0, 0.0, 0.0]
+    assert limiter.remaining == 3997
+
+
+def test_acquire_below_threshold_spaces_shared_slots(monkeypatch):
+    # Frozen clock: every call arrives at the same instant, as concurrent workers would
+    clock = FakeClock(advance=False)
+    monkeypatch.setattr(loader, "time", clock)
+    limiter = limiter_at(clock, remaining=50, reset_in=10)
+
+    for _ in range(4):
+        limiter.acquire()
+
+    # each caller gets the next slot, (reset - now) / remaining after the previous one
+    assert clock.sleeps == pytest.approx([0.0, 10 / 50, 10 / 50 + 10 / 49, 10 / 50 + 10 / 49 + 10 / 48])
+    assert limiter.remaining == 46
+
+
+def test_acquire_with_nothing_left_waits_for_reset(monkeypatch):
+    clock = FakeClock(advance=False)
+    monkeypatch.setattr(loader, "time", clock)
+    limiter = limiter_at(clock, remaining=0, reset_in=30)
+
+    limiter.acquire()
+    limiter.acquire()
+
+    assert clock.sleeps == [30.0, 30.0]
+
+
+def test_retry_delay_honors_retry_after_and_pauses_other_threads(monkeypatch):
+    clock = FakeClock(advance=False)
+    monkeypatch.setattr(loader, "time", clock)
+    limiter = limiter_at(clock, remaining=4000, reset_in=3600)
+
+    delay = limiter.retry_delay(httpx.Response(429, headers={"retry-after": "7"}), attempt=0)
+    limiter.acquire()
+
+    assert delay == 7.0
+    assert clock.sleeps == [7.0]
+
+
+def test_retry_delay_waits_for_primary_reset(monkeypatch):
+    clock = FakeClock(advance=False)
+    monkeypatch.setattr(loader, "time", clock)
+    limiter = limiter_at(clock, remaining=0, reset_in=20)
+
+    resp = httpx.Response(403, headers={"x-ratelimit-remaining": "0"})
+
+    assert limiter.retry_delay(resp, attempt=0) == 21.0
+
+
+def test_retry_delay_backs_off_exponentially_for_5xx(monkeypatch):
+    clock = FakeClock(advance=False)
+    monkeypatch.setattr(loader, "time", clock)
+    limiter = loader.GitHubRateLimiter(backoff_factor=0.5, max_backoff=60.0)
+
+    assert [limiter.retry_delay(httpx.Response(502), attempt=a) for a in (0, 1, 3, 10)] == [0.5, 1.0, 4.0, 60.0]
+    # a transient server error doesn't hold back the other threads
+    limiter.acquire()
+    assert clock.sleeps == [0.0]
+
+
+def test_retry_delay_waits_a_minute_for_secondary_limits(monkeypatch):
+    clock = FakeClock(advance=False)
+    monkeypatch.setattr(loader, "time", clock)
+    limiter = limiter_at(clock, remaining=4000, reset_in=3600)
+
+    secondary_403 = httpx.Response(403, json={"message": "You have exceeded a secondary rate limit."})
+
+    assert limiter.retry_delay(secondary_403, attempt=0) == loader.SECONDARY_LIMIT_WAIT
+    assert limiter.retry_delay(httpx.Response(429), attempt=0) == loader.SECONDARY_LIMIT_WAIT
+
+
+def test_retry_delay_does_not_retry_other_403s(monkeypatch):
+    clock = FakeClock(advance=False)
+    monkeypatch.setattr(loader, "time", clock)
+    limiter = limiter_at(clock, remaining=4000, reset_in=3600)
+
+    forbidden = httpx.Response(403, json={"message": "Resource not accessible by integration"})
+
+    assert limiter.retry_delay(forbidden, attempt=0) is None
+    limiter.acquire()
+    assert clock.sleeps == [0.0]
+
+
+# ----------------------------
+# PageQueue
+# ----------------------------
+def one_row_page():
+    return pa.RecordBatch.from_pylist(
+        [{"repo_full_name": "a/one", "user_login": "u", "user_id": 1, "starred_at": None, "extracted_at": None}],
+        schema=loader.STARGAZER_SCHEMA,
+    )
+
+
+def test_page_queue_put_blocks_at_maxsize_until_get():
+    q = loader.PageQueue(maxsize=2)
+    q.put(one_row_page())
+    q.put(one_row_page())
+
+    producer = threading.Thread(target=q.put, args=(one_row_page(),), daemon=True)
+    producer.start()
+    producer.join(timeout=0.2)
+    assert producer.is_alive()
+
+    q.get()
+    producer.join(timeout=2)
+    assert not producer.is_alive()
+
+
+def test_page_queue_put_control_never_blocks():
+    q = loader.PageQueue(maxsize=1)
+    q.put(one_row_page())
+
+    done = threading.Thread(target=lambda: [q.put_control(("done", i)) for i in range(10)], daemon=True)
+    done.start()
+    done.join(timeout=2)
+    assert not done.is_alive()
+
+    items = [q.get() for _ in range(11)]
+    assert isinstance(items[0], pa.RecordBatch)
+    assert items[1:] == [("done", i) for i in range(10)]
+
+
+# ----------------------------
+# post_graphql retries
+# ----------------------------
+def test_secondary_limit_403_waits_and_retries(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(loader, "time", clock)
+    responses = [
+        httpx.Response(
+            403,
+            json={"message": "You have exceeded a secondary rate limit. Please wait a few minutes before you try again."},
+            headers={"x-ratelimit-remaining": "4000", "x-ratelimit-reset": "9999999999"},
+        ),
+        httpx.Response(200, json={"data": {"ok": True}}),
+    ]
+    limiter = loader.GitHubRateLimiter()
+
+    with httpx.Client(transport=httpx.MockTransport(lambda request: responses.pop(0))) as client:
+        data = loader.post_graphql(client, limiter, GQL_URL, {"query": "{ ok }"})
+
+    assert data == {"data": {"ok": True}}
+    assert max(clock.sleeps) == loader.SECONDARY_LIMIT_WAIT
+
+
+# ----------------------------
+# first_page_batch
+# ----------------------------
+def test_first_page_batch_splits_aliases_and_drops_errored_ones():
+    github = FakeGitHub({"a/one": 150, "b/two": 5}, missing={"x/gone"})
+
+    with github.client() as client:
+        first_pages = loader.first_page_batch(
+            repo_slugs=["a/one", "x/gone", "b/two"],
+            direction="ASC",
+            gql_url=GQL_URL,
+            client=client,
+            limiter=loader.GitHubRateLimiter(),
+        )
+
+    assert github.posts == 1
+    assert set(first_pages) == {"a/one", "b/two"}
+
+    one = first_pages["a/one"]["data"]["repository"]["stargazers"]
+    assert len(one["edges"]) == 100
+    assert one["pageInfo"] == {"endCursor": "100", "hasNextPage": True}
+
+    two = first_pages["b/two"]["data"]["repository"]["stargazers"]
+    assert [e["node"]["login"] for e in two["edges"]] == [f"two-u{i}" for i in range(5)]
+
+
+def test_first_page_batch_falls_back_on_query_level_error():
+    def handler(request):
+        return httpx.Response(200, json={"errors": [{"message": "Something went wrong"}]})
+
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        first_pages = loader.first_page_batch(
+            repo_slugs=["a/one", "b/two"],
+            direction="ASC",
+            gql_url=GQL_URL,
+            client=client,
+            limiter=loader.GitHubRateLimiter(),
+        )
+
+    assert first_pages == {}
+
+
+# ----------------------------
+# fetch_repo_to_queue watermark stops (DESC: pages of 100 newest-first out of 250)
+# ----------------------------
+DESC_QUERY = "query { repository { stargazers(orderBy: {field: STARRED_AT, direction: DESC}) } }"
+
+
+class ListQueue(list):
+    """Stand-in for PageQueue when a single worker is driven directly."""
+
+    put = list.append
+
+
+def fetch_incremental(github, slug, watermark_str):
+    pages = ListQueue()
+    metrics = {}
+    with github.client() as client:
+        loader.fetch_repo_to_queue(
+            repo_slug=slug,
+            mode="incremental",
+            watermark_str=watermark_str,
+            gql_url=GQL_URL,
+            client=client,
+            limiter=loader.GitHubRateLimiter(),
+            query=DESC_QUERY,
+            extracted_at=datetime.now(timezone.utc),
+            out_queue=pages,
+            metrics=metrics,
+        )
+    starred_at = [ts for page in pages for ts in page.column("starred_at").to_pylist()]
+    return starred_at, metrics[slug]
+
+
+def test_watermark_at_or_after_first_edge_yields_nothing():
+    github = FakeGitHub({"a/one": 250})
+
+    starred_at, metrics = fetch_incremental(github, "a/one", star_ts(249))
+
+    assert starred_at == []
+    assert github.posts == 1
+    assert metrics == {"pages": 1, "yielded": 0, "stop_reason_watermark": 1}
+
+
+def test_watermark_inside_page_keeps_only_newer_edges():
+    github = FakeGitHub({"a/one": 250})
+
+    starred_at, metrics = fetch_incremental(github, "a/one", star_ts(219))
+
+    assert len(starred_at) == 30
+    assert min(starred_at) == BASE_TS + timedelta(hours=220)
+    assert github.posts == 1
+    assert metrics == {"pages": 1, "yielded": 30, "stop_reason_watermark": 1}
+
+
+def test_page_entirely_newer_than_watermark_continues_to_next_page():
+    github = FakeGitHub({"a/one": 250})
+
+    starred_at, metrics = fetch_incremental(github, "a/one", star_ts(99))
+
+    # first page (249..150) is all new, second page (149..50) is cut at the watermark;
+    # the third page is never requested
+    assert len(starred_at) == 150
+    assert min(starred_at) == BASE_TS + timedelta(hours=100)
+    assert github.posts == 2
+    assert metrics == {"pages": 2, "yielded": 150, "stop_reason_watermark": 1}
+
+
+# ----------------------------
+# Stage -> target merge and end-to-end runs against a temporary DuckDB
+# ----------------------------
+@pytest.fixture
+def repo_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("GITHUB_TOKEN", "test-token")
+    monkeypatch.setenv("DLT_DATA_DIR", str(tmp_path / ".dlt"))
+    (tmp_path / "config").mkdir()
+    (tmp_path / "config" / "config.json").write_bytes(orjson.dumps({"repos": ["a/one", "b/two", "c/three"]}))
+    return tmp_path
+
+
+def stars_by_repo(db_path):
+    with duckdb.connect(str(db_path), read_only=True) as con:
+        return {
+            repo: (rows, users)
+            for repo, rows, users in con.execute("""
+                SELECT repo_full_name, COUNT(*), COUNT(DISTINCT user_id)
+                FROM main.raw_github_stargazers
+                GROUP BY 1
+            """).fetchall()
+        }
+
+
+def test_merge_stage_into_stars_skips_existing_and_duplicate_rows(repo_dir):
+    db_path = repo_dir / "stars.duckdb"
+    with duckdb.connect(str(db_path)) as con:
+        columns = "repo_full_name VARCHAR, user_login VARCHAR, user_id BIGINT, starred_at TIMESTAMPTZ"
+        con.execute(f"CREATE TABLE main.raw_github_stargazers ({columns})")
+        con.execute(f"CREATE TABLE main.raw_github_stargazers_stage ({columns})")
+        con.execute("INSERT INTO main.raw_github_stargazers VALUES ('a/one', 'u1', 1, '2020-01-01 00:00:00+00')")
+        con.execute("""
+            INSERT INTO main.raw_github_stargazers_stage VALUES
+                ('a/one', 'u1', 1, '2020-01-05 00:00:00+00'),
+                ('a/one', 'u2', 2, '2020-01-02 00:00:00+00'),
+                ('a/one', 'u2', 2, '2020-01-03 00:00:00+00'),
+                ('b/two', 'u1', 1, '2020-01-04 00:00:00+00')
+        """)
+
+    pipeline = dlt.pipeline(
+        pipeline_name="merge_test",
+        destination=dlt.destinations.duckdb(credentials=str(db_path)),
+        dataset_name="main",
+    )
+    loader.merge_stage_into_stars(pipeline)
+
+    with duckdb.connect(str(db_path), read_only=True) as con:
+        rows = con.execute("""
+            SELECT repo_full_name, user_id, CAST(starred_at AS DATE)::VARCHAR
+            FROM main.raw_github_stargazers
+            ORDER BY 1, 2
+        """).fetchall()
+        staged = con.execute("SELECT COUNT(*) FROM main.raw_github_stargazers_stage").fetchone()[0]
+
+    assert rows == [
+        ("a/one", 1, "2020-01-01"),
+        ("a/one", 2, "2020-01-03"),
+        ("b/two", 1, "2020-01-04"),
+    ]
+    assert staged == 0
+
+
+def test_backfill_then_incremental(repo_dir, monkeypatch):
+    github = FakeGitHub({"a/one": 250, "b/two": 5, "c/three": 0})
+    monkeypatch.setattr(loader.httpx, "HTTPTransport", lambda **kwargs: httpx.MockTransport(github.handler))
+    db_path = repo_dir / "data" / "github_stars.duckdb"
+
+    loader.main(mode="backfill", log=lambda msg: None, base_dir=repo_dir)
+
+    # one batched first-page POST for all three repos, then a/one's pages 2 and 3
+    assert github.posts == 3
+    assert stars_by_repo(db_path) == {"a/one": (250, 250), "b/two": (5, 5)}
+
+    github.star_counts["a/one"] = 330
+    github.posts = 0
+    loader.main(mode="incremental", log=lambda msg: None, base_dir=repo_dir)
+
+    # every repo's newest page fits in the batched first-page POST
+    assert github.posts == 1
+    assert stars_by_repo(db_path) == {"a/one": (330, 330), "b/two": (5, 5)}
+
+
+def test_backfill_under_checkout_path_with_quote(tmp_path, monkeypatch):
+    repo_dir = tmp_path / "o'neil"
+    (repo_dir / "config").mkdir(parents=True)
+    (repo_dir / "config" / "config.json").write_bytes(orjson.dumps({"repos": ["b/two"]}))
+    monkeypatch.setenv("GITHUB_TOKEN", "test-token")
+    monkeypatch.setenv("DLT_DATA_DIR", str(tmp_path / ".dlt"))
+    github = FakeGitHub({"b/two": 5})
+    monkeypatch.setattr(loader.httpx, "HTTPTransport", lambda **kwargs: httpx.MockTransport(github.handler))
+
+    loader.main(mode="backfill", log=lambda msg: None, base_dir=repo_dir)
+
+    assert stars_by_repo(repo_dir / "data" / "github_stars.duckdb") == {"b/two": (5, 5)}
@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+import duckdb
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from reports.visualizations import build_stars_timeseries_summary
+
+
+def test_stars_timeseries_summary_drops_null_months():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE main.stargazer_by_month (repo_full_name VARCHAR, month TIMESTAMPTZ, stars BIGINT)")
+    con.execute("""
+        INSERT INTO main.stargazer_by_month VALUES
+            ('a/one', '2023-01-01 00:00:00+00', 1200),
+            ('a/one', '2024-03-01 00:00:00+00', 5),
+            ('b/two', '2024-06-01 00:00:00+00', 7),
+            ('b/two', NULL, 3)
+    """)
+
+    summary = build_stars_timeseries_summary(con)
+
+    assert list(summary.columns) == ["2023", "2024", "Total"]
+    assert list(summary.index) == ["a/one", "b/two", "Total"]
+    assert summary.loc["a/one"].tolist() == ["1,200", "5", "1,205"]
+    assert summary.loc["b/two"].tolist() == ["0", "7", "7"]
+    assert summary.loc["Total"].tolist() == ["1,200", "12", "1,212"]
@@ -1,21 +1,48 @@
 import os
-import json
 import argparse
+import tempfile
 import time
+from pathlib import Path
 from datetime import datetime, timezone
-from typing import Dict, Optional, Iterable, Any, List
-import requests
+from typing import Callable, Dict, Optional, Iterable, Iterator, Any, List, Sequence, Tuple
+import httpx
+import orjson
 import dlt
+import pyarrow as pa
+import pyarrow.parquet as pq
 from concurrent.futures import ThreadPoolExecutor, Future
-from queue import Queue
+from itertools import takewhile
+from collections import deque
 import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Fields selected for every page of stargazers
+STARGAZER_PAGE_FIELDS = "pageInfo { endCursor hasNextPage } edges { starredAt node { login databaseId } }"
+
+# Repos whose first pages are requested together in one aliased GraphQL query
+FIRST_PAGE_BATCH_SIZE = 20
+
+# Responses worth retrying: rate limits (403/429) and transient gateway errors
+RETRY_STATUSES = (403, 429, 502, 503, 504)
+
+# GitHub's guidance for a secondary rate limit without retry-after: wait at least a minute
+SECONDARY_LIMIT_WAIT = 60.0
+
+# Typed columns for raw_github_stargazers; pages are built straight into Arrow batches
+STARGAZER_SCHEMA = pa.schema(
+    [
+        ("repo_full_name", pa.string()),
+        ("login", pa.string()),
+        ("user_id", pa.int64()),
+        ("starred_at", pa.timestamp("s", tz="UTC")),
+        ("extracted_at", pa.timestamp("us", tz="UTC")),
+    ]
+)
+
 def load_config(path: str = "config/config.json") -> dict:
-    with open(path) as f:
-        return json.load(f)
+    return orjson.loads(Path(path).read_bytes())
 
 
 def parse_github_ts(ts: str) -> datetime:
@@ -25,32 +52,45 @@ def parse_github_ts(ts: str) -> datetime:
     return datetime.fromisoformat(ts)
 
 
-def utc_now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+def format_github_ts(dt: datetime) -> str:
+    # Inverse of parse_github_ts. GitHub's fixed-width UTC format sorts lexicographically,
+    # so formatted timestamps can be compared as plain strings.
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
-def get_repo_watermarks(pipeline) -> Dict[str, datetime]:
+def get_star_table_stats(pipeline) -> Tuple[int, Dict[str, int], Dict[str, datetime]]:
     """
-    Pure watermark approach: derive per-repo high-water marks from the destination table itself.
-    Returns {repo_full_name: max_starred_at_datetime_utc}.
+    One query over the destination table for run bookkeeping:
+    (total rows, {repo_full_name: rows}, {repo_full_name: max_starred_at_datetime_utc}).
+    The watermarks are the pure watermark approach: per-repo high-water marks derived from the
+    destination table itself. ROLLUP adds the grand-total row in the same pass.
     """
     sql = """
         SELECT
+            GROUPING(repo_full_name) AS is_total,
             repo_full_name,
+            COUNT(*) AS cnt,
             MAX(CAST(starred_at AS TIMESTAMP)) AS max_starred_at
         FROM main.raw_github_stargazers
-        GROUP BY 1
+        GROUP BY ROLLUP (repo_full_name)
     """
 
-    try:
-        with pipeline.sql_client() as client:
-            rows = client.execute_sql(sql)
-    except Exception:
-        # First run: table doesn't exist yet
-        return {}
+    # First run: table doesn't exist yet. Any other query failure should surface, not reset watermarks.
+    if not table_exists(pipeline, "main.raw_github_stargazers"):
+        return 0, {}, {}
+
+    with pipeline.sql_client() as client:
+        rows = client.execute_sql(sql)
+
+    total = 0
+    by_repo: Dict[str, int] = {}
+    watermarks: Dict[str, datetime] = {}
+    for is_total, repo_full_name, cnt, max_starred_at in rows:
+        if is_total:
+            total = int(cnt)
+            continue
+        by_repo[repo_full_name] = int(cnt)
 
-    out: Dict[str, datetime] = {}
-    for repo_full_name, max_starred_at in rows:
         if max_starred_at is None:
             continue
         # DuckDB often returns Python datetime already; handle strings defensively.
@@ -62,86 +102,275 @@ def get_repo_watermarks(pipeline) -> Dict[str, datetime]:
                 dt = dt.replace(tzinfo=timezone.utc)
             else:
                 dt = dt.astimezone(timezone.utc)
-        out[repo_full_name] = dt
+        watermarks[repo_full_name] = dt
+
+    return total, by_repo, watermarks
+
+
+class GitHubRateLimiter:
+    """
+    Shared pacing from GitHub's x-ratelimit-* response headers.
+    Requests go out at full speed while the budget is healthy; below `threshold` remaining,
+    send slots are handed out (reset_at - now) / remaining apart across all threads, so the
+    combined request rate lets the budget last until the window resets. With nothing left,
+    requests wait for the reset. A rate-limited response pauses every thread, not just the
+    one that got it.
+    """
+
+    def __init__(self, threshold: int = 100, backoff_factor: float = 0.5, max_backoff: float = 60.0) -> None:
+        self.threshold = threshold
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        self._next_send_at = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, headers: httpx.Headers) -> None:
+        remaining = headers.get("x-ratelimit-remaining")
+        reset_at = headers.get("x-ratelimit-reset")
+        if remaining is None or reset_at is None:
+            return
+        with self._lock:
+            self.remaining = int(remaining)
+            self.reset_at = float(reset_at)
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.time()
+            remaining, reset_at = self.remaining, self.reset_at
+            if remaining is None or reset_at is None or remaining >= self.threshold:
+                if remaining is not None and remaining > 0:
+                    self.remaining = remaining - 1
+                # Healthy budget: only a pause set by retry_delay holds this request back
+                send_at = max(now, self._next_send_at)
+            elif remaining > 0:
+                # Count this request against the budget until the next response refreshes it,
+                # and reserve the next shared send slot one interval after this one
+                self.remaining = remaining - 1
+                send_at = max(now, self._next_send_at)
+                self._next_send_at = send_at + max(reset_at - now, 0.0) / remaining
+            else:
+                send_at = max(now, self._next_send_at, reset_at)
+                self._next_send_at = send_at
+
+        time.sleep(max(send_at - now, 0.0))
+
+    def retry_delay(self, resp: httpx.Response, attempt: int) -> Optional[float]:
+        """
+        Seconds to wait before retrying a RETRY_STATUSES response, or None if it shouldn't be retried
+        (a 403 that isn't rate limiting). Honors retry-after, then the primary window reset, then
+        waits at least SECONDARY_LIMIT_WAIT for other 429s and rate-limit 403s; 5xx back off
+        exponentially. Rate-limit waits also push the shared send slot forward, so acquire()
+        holds every other thread until the same time.
+        """
+        retry_after = resp.headers.get("retry-after")
+        if retry_after is not None:
+            delay = float(retry_after)
+        elif resp.headers.get("x-ratelimit-remaining") == "0" and self.reset_at is not None:
+            delay = max(self.reset_at - time.time(), 0.0) + 1
+        elif resp.status_code == 429 or (resp.status_code == 403 and "rate limit" in resp.text.lower()):
+            delay = max(SECONDARY_LIMIT_WAIT, self.backoff_factor * 2 ** attempt)
+        elif resp.status_code != 403:
+            return min(self.backoff_factor * 2 ** attempt, self.max_backoff)
+        else:
+            return None
+
+        with self._lock:
+            self._next_send_at = max(self._next_send_at, time.time() + delay)
+        return delay
+
+
+class PageQueue:
+    """
+    Producer/consumer channel for pages of rows. deque append/popleft are atomic in CPython,
+    so a single Event handles wakeups and a Semaphore bounds in-flight pages (backpressure).
+    Control messages bypass the bound so a finishing worker never blocks on a full queue.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self._items: deque = deque()
+        self._not_empty = threading.Event()
+        self._slots = threading.Semaphore(maxsize)
+
+    def put(self, page: pa.RecordBatch) -> None:
+        self._slots.acquire()
+        self._items.append(page)
+        self._not_empty.set()
+
+    def put_control(self, message: Any) -> None:
+        self._items.append(message)
+        self._not_empty.set()
+
+    def get(self) -> Any:
+        while True:
+            try:
+                item = self._items.popleft()
+            except IndexError:
+                self._not_empty.wait()
+                self._not_empty.clear()
+                continue
+            if isinstance(item, pa.RecordBatch):
+                self._slots.release()
+            return item
+
+
+def post_graphql(
+    client: httpx.Client,
+    limiter: GitHubRateLimiter,
+    gql_url: str,
+    payload: Dict[str, Any],
+    max_retries: int = 5,
+) -> Dict[str, Any]:
+    """
+    POST a GraphQL payload through the shared client and limiter, retrying RETRY_STATUSES.
+    """
+    body = orjson.dumps(payload)
+    attempt = 0
+    while True:
+        limiter.acquire()
+        resp = client.post(gql_url, content=body)
+        limiter.update(resp.headers)
+        if resp.status_code in RETRY_STATUSES and attempt < max_retries:
+            delay = limiter.retry_delay(resp, attempt)
+            if delay is not None:
+                time.sleep(delay)
+                attempt += 1
+                continue
+        resp.raise_for_status()
+        return orjson.loads(resp.content)
+
+
+def first_page_batch(
+    *,
+    repo_slugs: Sequence[str],
+    direction: str,
+    gql_url: str,
+    client: httpx.Client,
+    limiter: GitHubRateLimiter,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch the first stargazer page of several repos in one POST using aliased `repository`
+    fields (r0, r1, ...). Returns {repo_slug: response} shaped like a single-repo query response,
+    so fetch_repo_to_queue can consume it as its first page. Repos whose alias errored are left
+    out and fetch their own first page (surfacing the error as before).
+    """
+    var_defs: List[str] = []
+    fields: List[str] = []
+    variables: Dict[str, str] = {}
+    for i, repo_slug in enumerate(repo_slugs):
+        owner, repo = repo_slug.split("/", 1)
+        var_defs.append(f"$o{i}: String!, $n{i}: String!")
+        fields.append(
+            f"r{i}: repository(owner: $o{i}, name: $n{i}) {{ "
+            f"stargazers(first: 100, orderBy: {{field: STARRED_AT, direction: {direction}}}) "
+            f"{{ {STARGAZER_PAGE_FIELDS} }} }}"
+        )
+        variables[f"o{i}"] = owner
+        variables[f"n{i}"] = repo
+
+    query = f"query ({', '.join(var_defs)}) {{ {' '.join(fields)} }}"
+    data = post_graphql(client, limiter, gql_url, {"query": query, "variables": variables})
+
+    errors = data.get("errors") or []
+    if any(not err.get("path") for err in errors):
+        # Query-level failure: let every worker fetch its own first page
+        return {}
+    failed = {err["path"][0] for err in errors}
 
-    return out
+    results = data.get("data") or {}
+    return {
+        repo_slug: {"data": {"repository": results.get(f"r{i}")}}
+        for i, repo_slug in enumerate(repo_slugs)
+        if f"r{i}" not in failed
+    }
 
 
 def fetch_repo_to_queue(
     *,
     repo_slug: str,
     mode: str,
-    watermark: Optional[datetime],
+    watermark_str: Optional[str],
     gql_url: str,
-    headers: Dict[str, str],
+    client: httpx.Client,
+    limiter: GitHubRateLimiter,
     query: str,
-    extracted_at: str,
-    out_queue: Queue,
+    extracted_at: datetime,
+    out_queue: PageQueue,
     metrics: Dict[str, Dict[str, int]],
+    first_page: Optional[Dict[str, Any]] = None,
+    max_retries: int = 5,
 ) -> None:
     """
-    Worker thread: fetch pages for a single repo and push row dicts into out_queue.
+    Worker thread: fetch pages for a single repo and push one Arrow RecordBatch per page into out_queue.
+    If first_page (from first_page_batch) is given, pagination continues from its endCursor.
     Updates metrics[repo_full_name] with counts.
     """
     owner, repo = repo_slug.split("/", 1)
     repo_full_name = f"{owner}/{repo}"
 
-    cursor = None
     pages = 0
     yielded = 0
     stop_reason = 0  # 0=exhausted, 1=watermark
 
-    # Optional: each thread can have its own Session (safe + a bit faster)
-    session = requests.Session()
-
-    while True:
-        payload = {"query": query, "variables": {"owner": owner, "name": repo, "after": cursor}}
-        resp = session.post(gql_url, headers=headers, json=payload, timeout=30)
-        resp.raise_for_status()
+    def fetch_page(after: Optional[str]) -> Dict[str, Any]:
+        payload = {"query": query, "variables": {"owner": owner, "name": repo, "after": after}}
+        return post_graphql(client, limiter, gql_url, payload, max_retries=max_retries)
+
+    # Single-thread prefetcher: the next page is requested as soon as this page's
+    # endCursor is known, so its round-trip overlaps with draining edges into the queue.
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        pending: Optional[Future]
+        if first_page is not None:
+            pending = Future()
+            pending.set_result(first_page)
+        else:
+            pending = prefetcher.submit(fetch_page, None)
 
-        data = resp.json()
-        if "errors" in data:
-            raise RuntimeError(f"GraphQL errors for {repo_slug}: {data['errors']}")
+        while pending is not None:
+            data = pending.result()
+            pending = None
 
-        repo_data = data.get("data", {}).get("repository")
-        if not repo_data:
-            break
+            if "errors" in data:
+                raise RuntimeError(f"GraphQL errors for {repo_slug}: {data['errors']}")
 
-        sg = repo_data["stargazers"]
-        pages += 1
+            repo_data = data.get("data", {}).get("repository")
+            if not repo_data:
+                break
 
-        # In incremental+DESC mode, stop once we hit <= watermark
-        for edge in sg["edges"]:
-            node = edge["node"]
-            starred_at_str = edge["starredAt"]
-            starred_at_dt = parse_github_ts(starred_at_str)
+            sg = repo_data["stargazers"]
+            pages += 1
+            edges = sg["edges"]
 
-            if mode == "incremental" and watermark is not None:
-                if starred_at_dt <= watermark:
+            # In incremental+DESC mode, stop once we hit <= watermark. Edges are newest-first,
+            # so the page's first and last starredAt tell whether the watermark falls inside it;
+            # only then are individual edges compared.
+            if mode == "incremental" and watermark_str is not None and edges:
+                if edges[0]["starredAt"] <= watermark_str:
+                    edges = []
+                    stop_reason = 1
+                elif edges[-1]["starredAt"] <= watermark_str:
+                    edges = list(takewhile(lambda e: e["starredAt"] > watermark_str, edges))
                     stop_reason = 1
-                    # Stop processing this page + all further pages
-                    sg = None  # just to avoid accidental use below
-                    cursor = None
-                    break
-
-            out_queue.put(
-                {
-                    "repo_full_name": repo_full_name,
-                    "login": node["login"],
-                    "user_id": node["databaseId"],
-                    "starred_at": starred_at_str,
-                    "extracted_at":  utc_now_iso(),
-                }
-            )
-            yielded += 1
-
-        if stop_reason == 1:
-            break
 
-        if sg["pageInfo"]["hasNextPage"]:
-            cursor = sg["pageInfo"]["endCursor"]
-        else:
-            break
+            if stop_reason == 0 and sg["pageInfo"]["hasNextPage"]:
+                pending = prefetcher.submit(fetch_page, sg["pageInfo"]["endCursor"])
+
+            # One queue operation per page rather than per row
+            if edges:
+                n = len(edges)
+                page = pa.RecordBatch.from_arrays(
+                    [
+                        pa.repeat(repo_full_name, n),
+                        pa.array([e["node"]["login"] for e in edges], pa.string()),
+                        pa.array([e["node"]["databaseId"] for e in edges], pa.int64()),
+                        pa.array([e["starredAt"] for e in edges]).cast(STARGAZER_SCHEMA.field("starred_at").type),
+                        pa.repeat(pa.scalar(extracted_at, STARGAZER_SCHEMA.field("extracted_at").type), n),
+                    ],
+                    schema=STARGAZER_SCHEMA,
+                )
+                out_queue.put(page)
+                yielded += n
 
     # store simple metrics (thread-safe update via lock)
     metrics[repo_full_name] = {
@@ -151,48 +380,47 @@ def fetch_repo_to_queue(
     }
 
 
-@dlt.resource(
-    name="raw_github_stargazers",
-    write_disposition="merge",
-    primary_key=["repo_full_name", "user_id"],
-)
-
-def github_stargazers(
+def iter_stargazer_pages(
     mode: str = "backfill",
     repo_watermarks: Optional[Dict[str, datetime]] = None,
     max_workers: Optional[int] = None,
-    queue_maxsize: int = 10_000,
-) -> Iterable[Dict[str, Any]]:
+    queue_maxsize: int = 128,
+    log: Callable[[str], None] = print,
+    config_path: str = "config/config.json",
+) -> Iterator[pa.RecordBatch]:
+    """
+    Fetch stargazers for all configured repos in parallel, yielding one RecordBatch per page.
+    """
     token = os.environ.get("GITHUB_TOKEN")
     if not token:
         raise RuntimeError("GITHUB_TOKEN environment variable not set")
 
-    config = load_config()
+    config = load_config(config_path)
     repos: List[str] = config["repos"]
 
     gql_url = "https://api.github.com/graphql"
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/vnd.github+json"}
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/vnd.github+json",
+        "Content-Type": "application/json",
+    }
 
     direction = "ASC" if mode == "backfill" else "DESC"
     query = f"""
     query ($owner: String!, $name: String!, $after: String) {{
       repository(owner: $owner, name: $name) {{
         stargazers(first: 100, after: $after, orderBy: {{field: STARRED_AT, direction: {direction}}}) {{
-          pageInfo {{ endCursor hasNextPage }}
-          edges {{
-            starredAt
-            node {{ login databaseId }}
-          }}
+          {STARGAZER_PAGE_FIELDS}
         }}
       }}
     }}
     """
 
-    extracted_at = utc_now_iso()
+    extracted_at = datetime.now(timezone.utc)
     repo_watermarks = repo_watermarks or {}
 
-    # Shared queue for streaming rows back to the main generator
-    q: Queue = Queue(maxsize=queue_maxsize)
+    # Shared queue for streaming pages of rows back to the main generator (maxsize counts pages)
+    q = PageQueue(maxsize=queue_maxsize)
 
     # Sentinels / coordination
     done_sentinel = object()
@@ -202,10 +430,16 @@ def github_stargazers(
     metrics: Dict[str, Dict[str, int]] = {}
     metrics_lock = threading.Lock()
 
+    limiter = GitHubRateLimiter()
+
+    # First pages for every repo, FIRST_PAGE_BATCH_SIZE repos per POST (filled in below)
+    first_pages: Dict[str, Dict[str, Any]] = {}
+
     def worker_wrapper(repo_slug: str) -> None:
         owner, repo = repo_slug.split("/", 1)
         repo_full_name = f"{owner}/{repo}"
         watermark = repo_watermarks.get(repo_full_name) if mode == "incremental" else None
+        watermark_str = format_github_ts(watermark) if watermark is not None else None
 
         # local metrics holder to avoid partial updates
         local_metrics: Dict[str, Dict[str, int]] = {}
@@ -214,28 +448,56 @@ def github_stargazers(
             fetch_repo_to_queue(
                 repo_slug=repo_slug,
                 mode=mode,
-                watermark=watermark,
+                watermark_str=watermark_str,
                 gql_url=gql_url,
-                headers=headers,
+                client=client,
+                limiter=limiter,
                 query=query,
                 extracted_at=extracted_at,
                 out_queue=q,
                 metrics=local_metrics,
+                first_page=first_pages.get(repo_slug),
             )
             with metrics_lock:
                 metrics.update(local_metrics)
         except Exception as e:
             # Send the exception object to main thread
-            q.put((error_sentinel, repo_slug, e))
+            q.put_control((error_sentinel, repo_slug, e))
         finally:
             # Signal this repo is done
-            q.put((done_sentinel, repo_slug, None))
-
-    # choose worker count (small is safer for rate limits)
-    workers = max_workers or min(len(repos), 5)
+            q.put_control((done_sentinel, repo_slug, None))
+
+    # choose worker count (the shared limiter paces requests as the rate-limit budget drains)
+    workers = max_workers or min(len(repos), 20)
+
+    # One HTTP/2 client shared by all workers: requests multiplex over a single TLS
+    # connection instead of each thread doing its own handshake. The pool is sized for
+    # each worker plus its page prefetch; the transport retries failed connects.
+    client = httpx.Client(
+        transport=httpx.HTTPTransport(
+            http2=True,
+            retries=3,
+            limits=httpx.Limits(max_connections=workers * 2, max_keepalive_connections=workers),
+        ),
+        headers=headers,
+        timeout=30,
+    )
 
     # Launch workers
-    with ThreadPoolExecutor(max_workers=workers) as executor:
+    with client, ThreadPoolExecutor(max_workers=workers) as executor:
+        # Incremental runs usually stop within a repo's first page, so batching first pages
+        # collapses most of a run's round-trips into one aliased query per batch.
+        for i in range(0, len(repos), FIRST_PAGE_BATCH_SIZE):
+            first_pages.update(
+                first_page_batch(
+                    repo_slugs=repos[i:i + FIRST_PAGE_BATCH_SIZE],
+                    direction=direction,
+                    gql_url=gql_url,
+                    client=client,
+                    limiter=limiter,
+                )
+            )
+
         futures: List[Future] = [executor.submit(worker_wrapper, repo_slug) for repo_slug in repos]
 
         done_count = 0
@@ -257,7 +519,7 @@ def github_stargazers(
                     f.cancel()
                 raise RuntimeError(f"Worker failed for repo {repo_slug}: {exc}") from exc
 
-            # Otherwise it's a normal row dict
+            # Otherwise it's a page (RecordBatch)
             yield item
 
         # Ensure any exceptions in futures are surfaced
@@ -266,11 +528,97 @@ def github_stargazers(
 
     # Optional: print per-repo fetch metrics (will show in stdout before dlt printout)
     # (comment out if you want totally clean output)
-    print("\nFetch metrics (parallel):")
+    log("\nFetch metrics (parallel):")
     for repo_full_name in sorted(metrics.keys()):
         m = metrics[repo_full_name]
         reason = "watermark" if m.get("stop_reason_watermark") == 1 else "exhausted"
-        print(f"  {repo_full_name}: pages={m.get('pages',0)} yielded={m.get('yielded',0)} stop={reason}")
+        log(f"  {repo_full_name}: pages={m.get('pages',0)} yielded={m.get('yielded',0)} stop={reason}")
+
+
+@dlt.resource(
+    name="raw_github_stargazers_stage",
+    write_disposition="append",
+)
+
+def github_stargazers(
+    mode: str = "backfill",
+    repo_watermarks: Optional[Dict[str, datetime]] = None,
+    max_workers: Optional[int] = None,
+    queue_maxsize: int = 128,
+    log: Callable[[str], None] = print,
+    config_path: str = "config/config.json",
+) -> Iterable[List[Dict[str, Any]]]:
+    # Incremental deltas are small, so they keep dlt's row-based path into the stage table
+    for page in iter_stargazer_pages(
+        mode=mode,
+        repo_watermarks=repo_watermarks,
+        max_workers=max_workers,
+        queue_maxsize=queue_maxsize,
+        log=log,
+        config_path=config_path,
+    ):
+        yield page.to_pylist()
+
+
+def load_backfill(pipeline, pages: Iterable[pa.RecordBatch], stage_parent: Path = Path("data")) -> str:
+    """
+    Backfill bypasses dlt's per-row normalize/merge: pages stream into a staged Parquet file
+    which DuckDB loads into main.raw_github_stargazers in a single statement.
+    The dlt bookkeeping columns are filled in so rows merged from the dlt stage table line up by name.
+    """
+    rows = 0
+    with tempfile.TemporaryDirectory(dir=stage_parent) as stage_dir:
+        stage_path = Path(stage_dir) / "raw_github_stargazers.parquet"
+        with pq.ParquetWriter(stage_path, STARGAZER_SCHEMA) as writer:
+            for page in pages:
+                writer.write_batch(page)
+                rows += page.num_rows
+
+        load_id = str(time.time())
+        with pipeline.sql_client() as client:
+            # The staged path sits under the user's checkout, so it's bound rather than quoted into the SQL
+            client.execute_sql(
+                f"""
+                CREATE OR REPLACE TABLE main.raw_github_stargazers AS
+                SELECT
+                    *,
+                    '{load_id}' AS _dlt_load_id,
+                    CAST(uuid() AS VARCHAR) AS _dlt_id
+                FROM read_parquet(?)
+                """,
+                stage_path.as_posix(),
+            )
+
+    return f"Backfill loaded {rows:,} rows into main.raw_github_stargazers from Parquet staging"
+
+
+def merge_stage_into_stars(pipeline) -> None:
+    """
+    Move new rows from the dlt stage table into main.raw_github_stargazers with one anti-join
+    insert (rows whose (repo_full_name, user_id) already exist are skipped), then empty the stage.
+    """
+    if not table_exists(pipeline, "main.raw_github_stargazers_stage"):
+        # Nothing was staged (no new rows on the first incremental run)
+        return
+
+    with pipeline.sql_client() as client:
+        with client.begin_transaction():
+            client.execute_sql("""
+                CREATE TABLE IF NOT EXISTS main.raw_github_stargazers AS
+                SELECT * FROM main.raw_github_stargazers_stage LIMIT 0
+            """)
+            client.execute_sql("""
+                INSERT INTO main.raw_github_stargazers BY NAME
+                SELECT s.*
+                FROM main.raw_github_stargazers_stage s
+                LEFT JOIN main.raw_github_stargazers t USING (repo_full_name, user_id)
+                WHERE t.user_id IS NULL
+                QUALIFY row_number() OVER (
+                    PARTITION BY s.repo_full_name, s.user_id
+                    ORDER BY s.starred_at DESC
+                ) = 1
+            """)
+            client.execute_sql("TRUNCATE main.raw_github_stargazers_stage")
 
 
 def table_exists(pipeline, full_table_name: str) -> bool:
@@ -290,89 +638,92 @@ def table_exists(pipeline, full_table_name: str) -> bool:
         return False
 
 
-def get_total_star_rows(pipeline) -> int:
-    sql = "SELECT COUNT(*) FROM main.raw_github_stargazers"
-    with pipeline.sql_client() as client:
-        return int(client.execute_sql(sql)[0][0])
-
-
-def get_repo_star_rows(pipeline) -> Dict[str, int]:
-    sql = """
-      SELECT repo_full_name, COUNT(*) AS cnt
-      FROM main.raw_github_stargazers
-      GROUP BY 1
+def main(
+    mode: str = "incremental",
+    workers: Optional[int] = None,
+    log: Callable[[str], None] = print,
+    base_dir: Path = Path("."),
+) -> None:
     """
-    with pipeline.sql_client() as client:
-        rows = client.execute_sql(sql)
-    return {r[0]: int(r[1]) for r in rows}
-
-def main():
-    parser = argparse.ArgumentParser(description="GitHub stargazer pipeline")
-    parser.add_argument("--mode", choices=["backfill", "incremental"], default="incremental")
-    parser.add_argument(
-        "--workers",
-        type=int,
-        default=None,
-        help="Number of concurrent repo fetch workers (default: min(num_repos, 5))",
-    )
-    args = parser.parse_args()
-
-    db_path = os.path.join("data", "github_stars.duckdb")
-    os.makedirs("data", exist_ok=True)
-    os.environ["DESTINATION__DUCKDB__CREDENTIALS__DATABASE"] = db_path
+    Run the stargazer pipeline in-process.
+    `log` receives progress lines (print by default, context.log.info under Dagster).
+    config/ and data/ are resolved against `base_dir` (the repo root), never the process cwd.
+    """
+    base_dir = Path(base_dir)
+    config_path = str(base_dir / "config" / "config.json")
+    data_dir = base_dir / "data"
+    db_path = str(data_dir / "github_stars.duckdb")
+    data_dir.mkdir(parents=True, exist_ok=True)
 
     pipeline = dlt.pipeline(
         pipeline_name="github_stargazers",
-        destination="duckdb",
+        destination=dlt.destinations.duckdb(credentials=db_path),
         dataset_name="main",
     )
 
     # --- BACKFILL: drop the DuckDB database file (full rebuild) ---
-    if args.mode == "backfill":
-        db_path = os.path.join("data", "github_stars.duckdb")
+    if mode == "backfill":
         if os.path.exists(db_path):
             os.remove(db_path)
-            print(f"🧹 BACKFILL selected: deleted DB {db_path}")
+            log(f"🧹 BACKFILL selected: deleted DB {db_path}")
 
-    # --- before counts ---
-    has_table = table_exists(pipeline, "main.raw_github_stargazers")
-    before_total = get_total_star_rows(pipeline) if has_table else 0
-    before_by_repo = get_repo_star_rows(pipeline) if has_table else {}
-
-    repo_watermarks = {}
-    if args.mode == "incremental":
-        repo_watermarks = get_repo_watermarks(pipeline)
+    # --- before counts + watermarks ---
+    before_total, before_by_repo, repo_watermarks = get_star_table_stats(pipeline)
+    if mode != "incremental":
+        repo_watermarks = {}
 
     # --- run ---
     start_time = time.perf_counter()
 
-    info = pipeline.run(
-        github_stargazers(mode=args.mode, repo_watermarks=repo_watermarks)
-    )
+    if mode == "backfill":
+        info = load_backfill(
+            pipeline,
+            iter_stargazer_pages(mode=mode, max_workers=workers, log=log, config_path=config_path),
+            stage_parent=data_dir,
+        )
+    else:
+        info = pipeline.run(
+            github_stargazers(
+                mode=mode,
+                repo_watermarks=repo_watermarks,
+                max_workers=workers,
+                log=log,
+                config_path=config_path,
+            )
+        )
+        merge_stage_into_stars(pipeline)
 
     end_time = time.perf_counter()
     duration_seconds = end_time - start_time
 
     # --- after counts ---
-    after_total = get_total_star_rows(pipeline)
-    after_by_repo = get_repo_star_rows(pipeline)
+    after_total, after_by_repo, _ = get_star_table_stats(pipeline)
 
     new_rows = after_total - before_total
 
-    print(info)
-    print("")
-    print("✅ Stars table: main.raw_github_stargazers")
-    print(f"✅ Mode: {args.mode}")
-    print(f"⏱️  Runtime: {duration_seconds:.2f} seconds")
-    print(f"✅ New stars inserted (new rows): {new_rows:,}")
-    print(f"✅ Total stars in table: {after_total:,}")
+    log(str(info))
+    log("")
+    log("✅ Stars table: main.raw_github_stargazers")
+    log(f"✅ Mode: {mode}")
+    log(f"⏱️  Runtime: {duration_seconds:.2f} seconds")
+    log(f"✅ New stars inserted (new rows): {new_rows:,}")
+    log(f"✅ Total stars in table: {after_total:,}")
 
-    print("\nPer-repo new stars:")
+    log("\nPer-repo new stars:")
     for repo_full_name in sorted(after_by_repo.keys()):
         delta = after_by_repo[repo_full_name] - before_by_repo.get(repo_full_name, 0)
         if delta != 0:
-            print(f"  +{delta:,}  {repo_full_name}")
+            log(f"  +{delta:,}  {repo_full_name}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="GitHub stargazer pipeline")
+    parser.add_argument("--mode", choices=["backfill", "incremental"], default="incremental")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of concurrent repo fetch workers (default: min(num_repos, 20))",
+    )
+    args = parser.parse_args()
+    main(mode=args.mode, workers=args.workers)
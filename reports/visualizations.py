@@ -1,10 +1,14 @@
-import base64
-from io import BytesIO
+import gzip
+import math
+import json
+import os
+from html import escape
 from pathlib import Path
+from typing import Callable, Union
 
 import duckdb
 import pandas as pd
-import matplotlib.pyplot as plt
+import pyarrow as pa
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
@@ -13,27 +17,85 @@ from zoneinfo import ZoneInfo
 # Helpers
 # ----------------------------
 
-con = duckdb.connect("data/github_stars.duckdb")
-ts = con.execute(f"SELECT MAX(extracted_at) FROM main.raw_github_stargazers").fetchone()[0]
+DB_PATH = "data/github_stars.duckdb"
+
+
+def connect_report_db(path: Union[str, Path] = DB_PATH) -> duckdb.DuckDBPyConnection:
+    """
+    Open the one connection a report run uses. Read-only: the report never writes,
+    and it doesn't take the write lock the loader/dbt need.
+    """
+    con = duckdb.connect(str(path), read_only=True)
+    con.execute(f"PRAGMA threads={os.cpu_count() or 1}")
+    con.execute("PRAGMA memory_limit='2GB'")
+    return con
+
+
+def get_refresh_timestamp(con: duckdb.DuckDBPyConnection) -> str:
+    """Latest extraction time, formatted in New York time for the report header."""
+    ts = con.execute("SELECT MAX(extracted_at) FROM main.raw_github_stargazers").fetchone()[0]
+
+    if ts is None:
+        return "Unknown"
 
-if ts is None:
-    refresh_timestamp = "Unknown"
-else:
     # If DuckDB returns a naive datetime, assume UTC then convert to NY
     if isinstance(ts, datetime) and ts.tzinfo is None:
         ts = ts.replace(tzinfo=timezone.utc)
 
     ts_est = ts.astimezone(ZoneInfo("America/New_York")) if isinstance(ts, datetime) else ts
-    refresh_timestamp = ts_est.strftime("%m/%d/%Y %I:%M%p %Z").lstrip("0").replace(" 0", " ")
+    return ts_est.strftime("%m/%d/%Y %I:%M%p %Z").lstrip("0").replace(" 0", " ")
+
+
+# ----------------------------
+# Rendered-section cache (reused while the underlying data is unchanged)
+# ----------------------------
+CACHE_PATH = Path("reports") / ".report_cache.json"
+
+# Part of every cache key: bump whenever a section builder's output changes,
+# so HTML rendered by older code is never served for unchanged data.
+CACHE_VERSION = 1
 
-def fig_to_base64_png(fig, dpi: int = 160) -> str:
-    """Convert a matplotlib figure to a base64-encoded PNG string."""
-    buf = BytesIO()
-    fig.savefig(buf, format="png", dpi=dpi, bbox_inches="tight")
-    buf.seek(0)
-    encoded = base64.b64encode(buf.read()).decode("utf-8")
-    plt.close(fig)
-    return encoded
+
+def load_report_cache(path: Path = CACHE_PATH) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_report_cache(cache: dict, path: Path = CACHE_PATH) -> None:
+    path.write_text(json.dumps(cache), encoding="utf-8")
+
+
+def cached_section(cache: dict, name: str, key: tuple, build: Callable[[], str]) -> str:
+    """Return cache[name] if it was built for `key` by this CACHE_VERSION, otherwise build and store it."""
+    # Stringified so keys survive the JSON round-trip (timestamps, HUGEINT sums)
+    key = [CACHE_VERSION, *(str(part) for part in key)]
+    entry = cache.get(name)
+    if isinstance(entry, dict) and entry.get("key") == key:
+        return entry["value"]
+    value = build()
+    cache[name] = {"key": key, "value": value}
+    return value
+
+
+def data_fingerprint(con: duckdb.DuckDBPyConnection, table: str, value_col: str) -> tuple:
+    """Cheap change detector for a dbt model: last extraction time, row count and value sum."""
+    return con.execute(f"""
+        SELECT
+            (SELECT MAX(extracted_at) FROM main.raw_github_stargazers),
+            COUNT(*),
+            SUM({value_col})
+        FROM main.{table}
+    """).fetchone()
+
+
+def result_to_df(result: duckdb.DuckDBPyConnection) -> pd.DataFrame:
+    """Materialize a DuckDB result via Arrow with pyarrow-backed dtypes (strings stay in Arrow buffers)."""
+    arrow = result.arrow()
+    # DuckDB >= 1.5 returns a RecordBatchReader here, older versions a Table
+    table = arrow.read_all() if isinstance(arrow, pa.RecordBatchReader) else arrow
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
 
 
 def df_to_html_table(df: pd.DataFrame, table_class: str = "stargazer-table", index: bool = True) -> str:
@@ -41,50 +103,62 @@ def df_to_html_table(df: pd.DataFrame, table_class: str = "stargazer-table", ind
     return df.to_html(index=index, classes=table_class, border=0)
 
 
+def users_to_html_table(users: pd.DataFrame, table_class: str = "stargazer-table users-table") -> str:
+    """Render the two-column users table with a single join instead of DataFrame.to_html."""
+    rows = "".join(
+        # Deleted/ghost accounts can come through with a NULL login
+        f"<tr><td>{escape(user) if isinstance(user, str) else ''}</td><td>{count}</td></tr>"
+        for user, count in zip(users["User"], users["Repos Starred"])
+    )
+    return (
+        f'<table border="0" class="dataframe {table_class}">'
+        '<thead><tr style="text-align: right;"><th>User</th><th>Repos Starred</th></tr></thead>'
+        f"<tbody>{rows}</tbody>"
+        "</table>"
+    )
+
+
 # ----------------------------
 # NEW: Build time-series summary table (months as columns, repos as rows)
 # ----------------------------
 def build_stars_timeseries_summary(con: duckdb.DuckDBPyConnection) -> pd.DataFrame:
     """
     Year-level summary with row + column grand totals.
+    Yearly sums, totals and comma formatting are all done in DuckDB (CUBE + format),
+    so only repos x years pre-formatted cells reach pandas.
     """
-    df = con.execute("""
+    df = result_to_df(con.execute("""
+        WITH yearly AS (
+            SELECT
+                repo_full_name,
+                CAST(EXTRACT(year FROM CAST(month AS DATE)) AS VARCHAR) AS year,
+                stars
+            FROM main.stargazer_by_month
+            WHERE month IS NOT NULL
+        )
         SELECT
-            repo_full_name,
-            month,
-            stars
-        FROM main.stargazer_by_month
-    """).df()
-
-    df["month_dt"] = pd.to_datetime(df["month"])
-    df["year"] = df["month_dt"].dt.year
-
-    pivot = df.pivot_table(
-        index="repo_full_name",
-        columns="year",
-        values="stars",
-        fill_value=0,
-        aggfunc="sum",
+            CASE WHEN GROUPING(repo_full_name) = 1 THEN 'Total' ELSE repo_full_name END AS repo_full_name,
+            CASE WHEN GROUPING(year) = 1 THEN 'Total' ELSE year END AS year,
+            SUM(stars) AS stars,
+            format('{:,}', SUM(stars)) AS stars_display
+        FROM yearly
+        GROUP BY CUBE (repo_full_name, year)
+    """))
+
+    # Order columns chronologically, Total last
+    years = sorted(y for y in df["year"].unique() if y != "Total")
+
+    # Order repos by total stars desc, Total last
+    repo_totals = df[df["year"] == "Total"].set_index("repo_full_name")["stars"]
+    repos = repo_totals.drop("Total").sort_values(ascending=False).index
+
+    # Cells are already formatted with commas; repo/year pairs with no stars show 0
+    pivot_display = (
+        df.pivot(index="repo_full_name", columns="year", values="stars_display")
+        .reindex(index=[*repos, "Total"], columns=[*years, "Total"])
+        .fillna("0")
     )
 
-    # Order columns chronologically
-    pivot = pivot.reindex(sorted(pivot.columns), axis=1)
-
-    # Order repos by total stars desc
-    pivot = pivot.loc[pivot.sum(axis=1).sort_values(ascending=False).index]
-
-    # ----------------------------
-    # Add Grand Totals
-    # ----------------------------
-    pivot["Total"] = pivot.sum(axis=1)              # row totals
-    column_totals = pivot.sum(axis=0)                     # column totals
-    pivot.loc["Total"] = column_totals              # bottom row
-
-    # ----------------------------
-    # Format with commas
-    # ----------------------------
-    pivot_display = pivot.astype(int).apply(lambda col: col.map(lambda x: f"{x:,}"))
-
     pivot_display.index.name = None
     pivot_display.columns.name = None
     return pivot_display
@@ -93,16 +167,16 @@ def build_stars_timeseries_summary(con: duckdb.DuckDBPyConnection) -> pd.DataFra
 # Build: Summary distribution table
 # ----------------------------
 def build_repos_starred_summary(con: duckdb.DuckDBPyConnection, max_repos: int = 5) -> pd.DataFrame:
-    df = con.execute("""
-        SELECT repos_starred
+    # Count users per repo bucket (histogram computed in DuckDB; only max_repos rows come back)
+    rows = con.execute("""
+        SELECT repos_starred, COUNT(*) AS users
         FROM main.stargazer_by_user
-    """).df()
+        WHERE repos_starred BETWEEN 1 AND ?
+        GROUP BY 1
+        ORDER BY 1
+    """, [max_repos]).fetchall()
 
-    df = df[df["repos_starred"].between(1, max_repos)]
-
-    # Count users per repo bucket
-    counts = df["repos_starred"].value_counts().reindex(range(1, max_repos + 1), fill_value=0)
-    counts = counts.astype(int)
+    counts = pd.Series(dict(rows), dtype="int64").reindex(range(1, max_repos + 1), fill_value=0)
 
     total_users = counts.sum()
 
@@ -136,19 +210,40 @@ def build_repos_starred_summary(con: duckdb.DuckDBPyConnection, max_repos: int =
 # ----------------------------
 # Build: Chart (inline in HTML)
 # ----------------------------
-def build_stars_by_month_chart_base64(con: duckdb.DuckDBPyConnection) -> str:
+# Matplotlib's default (tab10) color cycle, so the chart keeps its familiar look
+CHART_COLORS = [
+    "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
+    "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf",
+]
+
+
+def nice_tick_step(max_value: float, target_ticks: int = 6) -> float:
+    """Round max_value / target_ticks up to 1, 2, 2.5 or 5 x 10^k."""
+    raw = max_value / target_ticks
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for multiple in (1, 2, 2.5, 5, 10):
+        if raw <= multiple * magnitude:
+            return multiple * magnitude
+    return 10 * magnitude
+
+
+def build_stars_by_month_chart_svg(
+    con: duckdb.DuckDBPyConnection,
+    width: int = 1400,
+    height: int = 700,
+) -> str:
     """
-    Builds the stacked bar chart exactly like your PNG version, but returns base64 PNG
-    so it can be embedded directly into HTML.
+    Builds the stacked stars-by-month bar chart as inline SVG markup,
+    so the report needs no matplotlib import or PNG rasterization.
     """
-    df = con.execute("""
+    df = result_to_df(con.execute("""
         SELECT
             repo_full_name,
             month,
             stars
         FROM main.stargazer_by_month
         ORDER BY month, repo_full_name
-    """).df()
+    """))
 
     df["month_dt"] = pd.to_datetime(df["month"])
     df["month"] = df["month_dt"].dt.strftime("%Y-%m")
@@ -162,35 +257,89 @@ def build_stars_by_month_chart_base64(con: duckdb.DuckDBPyConnection) -> str:
         ).sort_index()
     )
 
+    # Largest repo at the bottom of each stack
     totals = pivot.sum().sort_values(ascending=False)
     pivot = pivot[totals.index]
 
-    fig, ax = plt.subplots(figsize=(14, 7))
-    pivot.plot(kind="bar", stacked=True, ax=ax, width=0.85)
+    left, right, top, bottom = 80, 20, 20, 60
+    plot_w = width - left - right
+    plot_h = height - top - bottom
+    baseline = top + plot_h
+
+    slot = plot_w / max(len(pivot.index), 1)
+    bar_w = slot * 0.85
+
+    y_max = max(float(pivot.sum(axis=1).max()) if len(pivot.index) else 0.0, 1.0)
+    step = nice_tick_step(y_max)
+    y_top = math.ceil(y_max / step) * step
+    scale = plot_h / y_top
 
-    ax.set_xlabel("Year")
-    ax.set_ylabel("Stars")
+    parts = [
+        f'<svg class="chart" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" '
+        f'role="img" aria-label="Stars by Month (Stacked)" font-family="Arial, sans-serif" font-size="13">'
+    ]
 
-    month_dts = pd.to_datetime(pivot.index + "-01")
-    labels = [str(d.year) if d.month == 1 else "" for d in month_dts]
-    ax.set_xticklabels(labels, rotation=0)
+    # Y gridlines + tick labels
+    tick = 0.0
+    while tick <= y_top:
+        y = baseline - tick * scale
+        parts.append(f'<line x1="{left}" y1="{y:.1f}" x2="{left + plot_w}" y2="{y:.1f}" stroke="#e5e5e5" />')
+        parts.append(f'<text x="{left - 8}" y="{y + 4:.1f}" text-anchor="end" fill="#555">{tick:,.0f}</text>')
+        tick += step
+
+    # Stacked bars, plus a year label under each January
+    repos = [escape(str(r)) for r in pivot.columns]
+    values = pivot.to_numpy(dtype=float)
+    for i, month in enumerate(pivot.index):
+        x = left + i * slot + (slot - bar_w) / 2
+        stacked = 0.0
+        for j, value in enumerate(values[i]):
+            if value <= 0:
+                continue
+            y = baseline - (stacked + value) * scale
+            parts.append(
+                f'<rect x="{x:.2f}" y="{y:.2f}" width="{bar_w:.2f}" height="{value * scale:.2f}" '
+                f'fill="{CHART_COLORS[j % len(CHART_COLORS)]}"><title>{month} {repos[j]}: {value:,.0f}</title></rect>'
+            )
+            stacked += value
+        if month.endswith("-01"):
+            parts.append(
+                f'<text x="{x + bar_w / 2:.1f}" y="{baseline + 20}" text-anchor="middle" fill="#555">{month[:4]}</text>'
+            )
+
+    # Axes + titles
+    parts.append(f'<line x1="{left}" y1="{baseline}" x2="{left + plot_w}" y2="{baseline}" stroke="#111" />')
+    parts.append(f'<line x1="{left}" y1="{top}" x2="{left}" y2="{baseline}" stroke="#111" />')
+    parts.append(f'<text x="{left + plot_w / 2}" y="{height - 12}" text-anchor="middle">Year</text>')
+    parts.append(
+        f'<text x="18" y="{top + plot_h / 2}" text-anchor="middle" '
+        f'transform="rotate(-90 18 {top + plot_h / 2})">Stars</text>'
+    )
 
-    plt.tight_layout()
+    # Legend (top-left of the plot area)
+    for j, repo in enumerate(repos):
+        y = top + 12 + j * 20
+        parts.append(
+            f'<rect x="{left + 12}" y="{y}" width="14" height="14" fill="{CHART_COLORS[j % len(CHART_COLORS)]}" />'
+        )
+        parts.append(f'<text x="{left + 32}" y="{y + 12}">{repo}</text>')
 
-    return fig_to_base64_png(fig, dpi=160)
+    parts.append("</svg>")
+    return "".join(parts)
 
 
 # ----------------------------
 # Build: Detailed stargazers table (individual users)
 # ----------------------------
 def build_top_stargazers_table(con: duckdb.DuckDBPyConnection, top_n: int = 50) -> pd.DataFrame:
-    users = con.execute(f"""
+    users = result_to_df(con.execute("""
         SELECT
             login,
             repos_starred
         FROM main.stargazer_by_user
         ORDER BY repos_starred DESC, login ASC
-    """).df()
+        LIMIT ?
+    """, [top_n]))
 
     users = users.rename(columns={"login": "User", "repos_starred": "Repos Starred"})
     return users
@@ -199,25 +348,52 @@ def build_top_stargazers_table(con: duckdb.DuckDBPyConnection, top_n: int = 50)
 # ----------------------------
 # Save: Full HTML report (time series summary -> chart -> repos summary -> individual users)
 # ----------------------------
-def save_html_report(con: duckdb.DuckDBPyConnection, top_n: int = 50, max_repos: int = 5) -> None:
-    Path("reports").mkdir(parents=True, exist_ok=True)
+def save_html_report(
+    con: duckdb.DuckDBPyConnection,
+    top_n: int = 50,
+    max_repos: int = 5,
+    out_dir: Path = Path("reports"),
+) -> Path:
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cache_path = out_dir / CACHE_PATH.name
+
+    # Sections are rebuilt only when their source model changed since the last report
+    refresh_timestamp = get_refresh_timestamp(con)
+
+    cache = load_report_cache(cache_path)
+    month_key = data_fingerprint(con, "stargazer_by_month", "stars")
+    user_key = data_fingerprint(con, "stargazer_by_user", "repos_starred")
 
     # NEW ordering:
     # 1) time series summary table
-    timeseries_df = build_stars_timeseries_summary(con)
+    timeseries_html = cached_section(
+        cache, "timeseries_html", month_key,
+        lambda: df_to_html_table(
+            build_stars_timeseries_summary(con),
+            table_class="stargazer-table timeseries-table",
+            index=True,
+        ),
+    )
 
     # 2) bar chart directly underneath
-    chart_b64 = build_stars_by_month_chart_base64(con)
+    chart_svg = cached_section(cache, "chart_svg", month_key, lambda: build_stars_by_month_chart_svg(con))
 
     # 3) repos_starred distribution summary beneath chart
-    summary_df = build_repos_starred_summary(con, max_repos=max_repos)
+    summary_html = cached_section(
+        cache, "summary_html", (*user_key, max_repos),
+        lambda: build_repos_starred_summary(con, max_repos=max_repos).to_html(
+            classes="stargazer-table summary-table", border=0
+        ),
+    )
 
     # 4) individual table at the end
-    top_users_df = build_top_stargazers_table(con, top_n=top_n)
+    users_html = cached_section(
+        cache, "users_html", (*user_key, top_n),
+        lambda: users_to_html_table(build_top_stargazers_table(con, top_n=top_n)),
+    )
 
-    timeseries_html = df_to_html_table(timeseries_df, table_class="stargazer-table timeseries-table", index=True)
-    summary_html = summary_df.to_html(classes="stargazer-table summary-table", border=0)
-    users_html = top_users_df.to_html(index=False, classes="stargazer-table users-table", border=0)
+    save_report_cache(cache, cache_path)
 
     html = f"""
     <!doctype html>
@@ -385,7 +561,7 @@ def save_html_report(con: duckdb.DuckDBPyConnection, top_n: int = 50, max_repos:
     
 
     <div class="card">
-        <img class="chart" src="data:image/png;base64,{chart_b64}" alt="Stars by Month (Stacked)" />
+        {chart_svg}
     </div>
 
     <div class="card">
@@ -404,14 +580,23 @@ def save_html_report(con: duckdb.DuckDBPyConnection, top_n: int = 50, max_repos:
     </html>
     """.strip()
 
-    out_path = Path("reports") / "github_stargazer_dashboard.html"
+    out_path = out_dir / "github_stargazer_dashboard.html"
     out_path.write_text(html, encoding="utf-8")
-    print(f"Saved {out_path}")
+
+    # Pre-compressed copy for web servers that serve .html.gz directly (e.g. nginx gzip_static)
+    with gzip.open(out_path.with_suffix(".html.gz"), "wt", encoding="utf-8", compresslevel=6) as f:
+        f.write(html)
+
+    return out_path
 
 
 def main():
-    con = duckdb.connect("data/github_stars.duckdb")
-    save_html_report(con, top_n=50, max_repos=5)
+    con = connect_report_db()
+    try:
+        out_path = save_html_report(con, top_n=50, max_repos=5)
+    finally:
+        con.close()
+    print(f"Saved {out_path}")
 
 
 if __name__ == "__main__":